@@ -1,8 +1,15 @@
-import datetime
-import json
-from functools import cache
+import calendar
+from dataclasses import dataclass, field
+from functools import cache, lru_cache
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
 import resources
 from ui import VGroup, Context, ViewMeasurement, ViewAlignmentHorizontal, ImageView, ViewSize, TextView, HGroup, \
@@ -15,6 +22,8 @@ from typing import *
 
 
 class Location:
+    __slots__ = ('latitude', 'longitude', 'friendly_name')
+
     def __init__(self, latitude: float, longitude: float, friendly_name: str = None):
         self.latitude = latitude
         self.longitude = longitude
@@ -52,32 +61,38 @@ class WeatherEffectiveness(Enum):
     ANY = 3
 
 
+@dataclass(slots=True, eq=False)
 class Weather:
-    def __init__(self,
-                 time: pytime.struct_time = pytime.localtime(),
-                 effect: WeatherEffectiveness = WeatherEffectiveness.CURRENT,
-                 day: Day = Day.CLEAR,
-                 temperature: float = 22,
-                 humidity: float = 0.2,
-                 pressure: float = 10,
-                 uv_index: int = 5):
-        """
-        All these default parameters are for testing purpose, and
-        should be set by the weather provider.
-        :param day: the sky-con
-        :param effect: role this weather data's playing
-        :param temperature: value of temperature, unit dependent on the provider
-        :param humidity: range from 0-1 in percentage
-        :param pressure: air pressure in hPa
-        :param uv_index: range from 0-10, aka ultraviolet index
-        """
-        self.time = time
-        self.effect = effect
-        self.day = day
-        self.temperature = temperature
-        self.humidity = humidity
-        self.pressure = pressure
-        self.uv_index = uv_index
+    """
+    All these default parameters are for testing purpose, and
+    should be set by the weather provider.
+
+    Instances compare and hash by identity
+    :param day: the sky-con
+    :param effect: role this weather data's playing
+    :param temperature: value of temperature, unit dependent on the provider
+    :param humidity: range from 0-1 in percentage
+    :param pressure: air pressure in hPa
+    :param uv_index: range from 0-10, aka ultraviolet index
+    """
+    time: pytime.struct_time = pytime.localtime()
+    effect: WeatherEffectiveness = WeatherEffectiveness.CURRENT
+    day: Day = Day.CLEAR
+    temperature: float = 22
+    humidity: float = 0.2
+    pressure: float = 10
+    uv_index: int = 5
+    hours_since_epoch: int = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.hours_since_epoch = hours_of(self.time)
+
+
+def hours_of(time: pytime.struct_time) -> int:
+    """
+    Whole hours from the epoch to the wall time in `time`, ignoring its zone
+    """
+    return calendar.timegm(time) // 3600
 
 
 class WeatherProvider:
@@ -149,6 +164,46 @@ class DirectWeatherProvider(WeatherProvider):
         return [self.__weather]
 
 
+# marks a view that has not refreshed yet, as providers may return None
+_UNSET = object()
+
+_YDAY_OFFSET = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+_WDAY_OFFSET = (0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4)
+
+
+def _parse_caiyun_time(raw: str) -> pytime.struct_time:
+    """
+    Parse CaiYun's fixed-shape timestamps, YYYY-MM-DD optionally followed by
+    THH:MM and an offset, keeping the wall time as `datetime.timetuple` does
+    """
+    year, month, day = int(raw[0:4]), int(raw[5:7]), int(raw[8:10])
+    if len(raw) >= 16:
+        hour, minute = int(raw[11:13]), int(raw[14:16])
+    else:
+        hour = minute = 0
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    yday = _YDAY_OFFSET[month - 1] + day + (1 if leap and month > 2 else 0)
+    y = year - 1 if month < 3 else year
+    wday = (y + y // 4 - y // 100 + y // 400 + _WDAY_OFFSET[month - 1] + day + 6) % 7
+    return pytime.struct_time((year, month, day, hour, minute, 0, wday, yday, -1))
+
+
+_SKYCON_MAP = {
+    'light_rain': Day.LIGHTLY_RAINY,
+    'moderate_rain': Day.RAINY,
+    'heavy_rain': Day.HEAVILY_RAINY,
+    'storm_rain': Day.HEAVILY_RAINY,
+    'fog': Day.FOGGY,
+    'light_snow': Day.LIGHTLY_SNOWY,
+    'moderate_snow': Day.SNOWY,
+    'heavy_snow': Day.HEAVILY_SNOWY,
+    'storm_snow': Day.HEAVILY_SNOWY,
+    'dust': Day.DUSTY,
+    'sand': Day.SANDY,
+    'wind': Day.WINDY,
+}
+
+
 class CaiYunWeatherProvider(CachedWeatherProvider):
     """
     A real implementation of CaiYun Weather, a Chinese weather provider
@@ -163,12 +218,22 @@ class CaiYunWeatherProvider(CachedWeatherProvider):
         """
         super().__init__(location, TemperatureUnit.CELSIUS, cache_invalidate_interval)
         self.api_key = api_key
+        self.__session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+        self.__session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry))
+
+    def close(self):
+        """
+        Release the pooled connections to the API
+        """
+        self.__session.close()
 
     def __get_api_url(self):
         return f'https://api.caiyunapp.com/v2.6/{self.api_key}/' \
                f'{self.get_location().longitude},{self.get_location().latitude}'
 
     @staticmethod
+    @cache
     def __caiyun_get_day(raw: str) -> Day:
         """
         See https://docs.caiyunapp.com/docs/tables/skycon/ for full list
@@ -176,44 +241,28 @@ class CaiYunWeatherProvider(CachedWeatherProvider):
         :return: my interface
         """
         raw = raw.lower()
+        day = _SKYCON_MAP.get(raw)
+        if day is not None:
+            return day
         if 'clear' in raw:
             return Day.CLEAR
         elif 'cloudy' in raw:
             return Day.CLOUDY
         elif 'haze' in raw:
             return Day.HAZY
-        elif raw == 'light_rain':
-            return Day.LIGHTLY_RAINY
-        elif raw == 'moderate_rain':
-            return Day.RAINY
-        elif raw == 'heavy_rain' or raw == 'storm_rain':
-            return Day.HEAVILY_RAINY
-        elif raw == 'fog':
-            return Day.FOGGY
-        elif raw == 'light_snow':
-            return Day.LIGHTLY_SNOWY
-        elif raw == 'moderate_snow':
-            return Day.SNOWY
-        elif raw == 'heavy_snow' or raw == 'storm_snow':
-            return Day.HEAVILY_SNOWY
-        elif raw == 'dust':
-            return Day.DUSTY
-        elif raw == 'sand':
-            return Day.SANDY
-        elif raw == 'wind':
-            return Day.WINDY
         else:
             return Day.UNKNOWN
 
     def invalidate(self) -> List[Weather]:
-        response = requests.get(self.__get_api_url() + '/weather?dailysteps=3&hourlysteps=24&minutely=false')
+        response = self.__session.get(self.__get_api_url() + '/weather?dailysteps=3&hourlysteps=24&minutely=false',
+                                      timeout=(3.05, 10))
         if not response.ok:
             raise IOError('Realtime API not responding')
 
-        api_callback = json.loads(response.text)
-        result_realtime = api_callback['result']['realtime']
-        result_hourly = api_callback['result']['hourly']
-        result_daily = api_callback['result']['daily']
+        result = _json.loads(response.content)['result']
+        result_realtime = result['realtime']
+        result_hourly = result['hourly']
+        result_daily = result['daily']
         current_weather = Weather(
             time=pytime.localtime(),
             effect=WeatherEffectiveness.CURRENT,
@@ -227,31 +276,35 @@ class CaiYunWeatherProvider(CachedWeatherProvider):
         daily_weather = []
 
         def parse(target_set: List[Weather], source: Dict, effect: WeatherEffectiveness):
-            def pick(unit: Dict):
-                if 'value' in unit:
-                    return unit['value']
-                elif 'avg' in unit:
-                    return unit['avg']
-                else:
-                    raise ValueError(unit)
-
-            for i in range(len(source['precipitation'])):
-                precipitation = source['precipitation'][i]
-                if 'datetime' in precipitation:
-                    time = datetime.datetime.fromisoformat(precipitation['datetime']).timetuple()
-                elif 'date' in precipitation:
-                    time = datetime.datetime.fromisoformat(precipitation['date']).timetuple()
-                else:
-                    raise ValueError(precipitation)
-
-                temperature = pick(source['temperature'][i])
-                humidity = pick(source['humidity'][i])
-                sky_con = pick(source['skycon'][i])
-                pressure = pick(source['pressure'][i])
+            precipitations = source['precipitation']
+            if not precipitations:
+                return
+            temperatures = source['temperature']
+            humidities = source['humidity']
+            sky_cons = source['skycon']
+            pressures = source['pressure']
+
+            # the schema is uniform within a section, so pick the keys once
+            def pick_key(row: Dict, *candidates: str) -> str:
+                for key in candidates:
+                    if key in row:
+                        return key
+                raise ValueError(row)
+
+            time_key = pick_key(precipitations[0], 'datetime', 'date')
+            temperature_key = pick_key(temperatures[0], 'value', 'avg')
+            humidity_key = pick_key(humidities[0], 'value', 'avg')
+            sky_con_key = pick_key(sky_cons[0], 'value', 'avg')
+            pressure_key = pick_key(pressures[0], 'value', 'avg')
+
+            get_day = self.__caiyun_get_day
+            for i in range(len(precipitations)):
                 target_set.append(
                     Weather(
-                        time, effect, self.__caiyun_get_day(sky_con),
-                        temperature, humidity, pressure, -1
+                        _parse_caiyun_time(precipitations[i][time_key]), effect,
+                        get_day(sky_cons[i][sky_con_key]),
+                        temperatures[i][temperature_key], humidities[i][humidity_key],
+                        pressures[i][pressure_key], -1
                     )
                 )
 
@@ -261,47 +314,61 @@ class CaiYunWeatherProvider(CachedWeatherProvider):
         return [current_weather] + hourly_weather + daily_weather
 
 
+@cache
 def get_weather_icon(day: Day):
-    if day == Day.CLEAR:
+    if day is Day.CLEAR:
         return resources.get_image_tint('weather-sunny', 100)
-    elif day == Day.CLOUDY:
+    elif day is Day.CLOUDY:
         return resources.get_image('weather-cloudy')
-    elif day == Day.RAINY or day == Day.LIGHTLY_RAINY:
+    elif day is Day.RAINY or day is Day.LIGHTLY_RAINY:
         return resources.get_image('weather-rainy')
-    elif day == Day.HEAVILY_RAINY:
+    elif day is Day.HEAVILY_RAINY:
         return resources.get_image('weather-pouring')
-    elif day == Day.SNOWY or day == Day.LIGHTLY_SNOWY:
+    elif day is Day.SNOWY or day is Day.LIGHTLY_SNOWY:
         return resources.get_image('weather-snowy')
-    elif day == Day.HEAVILY_SNOWY:
+    elif day is Day.HEAVILY_SNOWY:
         return resources.get_image('weather-snowy-heavy')
-    elif day == Day.SNOWY_RAINY:
+    elif day is Day.SNOWY_RAINY:
         return resources.get_image('weather-snowy-rainy')
-    elif day == Day.WINDY:
+    elif day is Day.WINDY:
         return resources.get_image('weather-windy')
-    elif day == Day.HAZY:
+    elif day is Day.HAZY:
         return resources.get_image('weather-hazy')
-    elif day == Day.FOGGY:
+    elif day is Day.FOGGY:
         return resources.get_image('weather-fog')
-    elif day == Day.DUSTY:
+    elif day is Day.DUSTY:
         return resources.get_image('weather-dust')
     else:
         return resources.get_image('weather-alert')
 
 
+@lru_cache(maxsize=64)
+def _icon_for(day: Day, width: int, height: int) -> Image.Image:
+    """
+    The weather icon already resized to what the views lay it out as,
+    so `ImageView` can draw it without resizing on every frame
+    """
+    return get_weather_icon(day).resize((width, height))
+
+
+@cache
 def get_day_name(day: Day):
     return day.name.replace('_', ' ').capitalize()
 
 
+@cache
 def get_unit_name(unit: TemperatureUnit):
-    if unit == TemperatureUnit.CELSIUS:
+    if unit is TemperatureUnit.CELSIUS:
         return '°C'
-    elif unit == TemperatureUnit.FAHRENHEIT:
+    elif unit is TemperatureUnit.FAHRENHEIT:
         return '°F'
     else:
         return 'K'
 
 
 class LargeWeatherView(HGroup):
+    ICON_SIZE = 100
+
     def __init__(self, context: Context, provider: WeatherProvider,
                  effect: WeatherEffectiveness = WeatherEffectiveness.CURRENT,
                  prefer: ViewMeasurement = ViewMeasurement.default()):
@@ -310,7 +377,9 @@ class LargeWeatherView(HGroup):
         self.__effect = effect
         self.__icon_view = None
         self.__day_label_view = None
-        self.__subtitle_label_view = None
+        self.__subtitle_value_view = None
+        self.__subtitle_unit_view = None
+        self.__last_source = _UNSET
         self.refresh()
 
     def get_provider(self):
@@ -319,38 +388,49 @@ class LargeWeatherView(HGroup):
     def set_provider(self, provider: WeatherProvider):
         if self.__provider != provider:
             self.__provider = provider
+            self.__last_source = _UNSET
             self.refresh()
 
     def get_effect(self):
         return self.__effect
 
     def set_effect(self, effect: WeatherEffectiveness):
-        if self.__effect != effect:
+        if self.__effect is not effect:
             self.__effect = effect
+            self.__last_source = _UNSET
             self.refresh()
 
-    def __get_detailed_label(self, weather: Weather):
-        return f'{weather.temperature} {get_unit_name(self.__provider.get_temperature_unit())}\n' \
-               f'{int(weather.humidity * 100)} %\n' \
-               f'{int(weather.pressure)} hPa\n' \
-               f'{weather.uv_index} UV'
+    def __get_detailed_values(self, weather: Weather):
+        return f'{weather.temperature}\n' \
+               f'{int(weather.humidity * 100)}\n' \
+               f'{int(weather.pressure)}\n' \
+               f'{weather.uv_index}'
+
+    def __get_detailed_units(self):
+        return f'{get_unit_name(self.__provider.get_temperature_unit())}\n%\nhPa\nUV'
 
     def __add_views(self, weather: Weather):
         title_group = VGroup(self.context, alignment=ViewAlignmentHorizontal.RIGHT)
         self.__icon_view = ImageView(self.context,
-                                     image=get_weather_icon(weather.day),
+                                     image=_icon_for(weather.day, self.ICON_SIZE, self.ICON_SIZE),
                                      prefer=ViewMeasurement.default(
-                                         width=100,
-                                         height=100
+                                         width=self.ICON_SIZE,
+                                         height=self.ICON_SIZE
                                      ))
         self.__day_label_view = TextView(self.context,
                                          text=get_day_name(weather.day),
                                          font=TextView.default_font_bold,
                                          font_size=36)
-        self.__subtitle_label_view = TextView(self.context,
-                                              text=self.__get_detailed_label(weather),
+        subtitle_group = HGroup(self.context, alignment=ViewAlignmentVertical.TOP)
+        self.__subtitle_value_view = TextView(self.context,
+                                              text=self.__get_detailed_values(weather),
                                               font_size=20,
                                               line_align=ViewAlignmentHorizontal.RIGHT)
+        self.__subtitle_unit_view = TextView(self.context,
+                                             text=self.__get_detailed_units(),
+                                             font_size=20,
+                                             prefer=ViewMeasurement.default(margin_left=6))
+        subtitle_group.add_views(self.__subtitle_value_view, self.__subtitle_unit_view)
         self.add_views(
             self.__icon_view,
             Surface(self.context,
@@ -365,24 +445,35 @@ class LargeWeatherView(HGroup):
         )
         title_group.add_views(
             self.__day_label_view,
-            self.__subtitle_label_view
+            subtitle_group
         )
 
     def refresh(self):
-        weather = next(weather for weather in self.__provider.get_weather()
-                       if weather.effect == self.__effect)
+        source = self.__provider.get_weather()
+        if source is self.__last_source:
+            return
+        if source[0].effect is self.__effect:
+            # providers list the current weather first
+            weather = source[0]
+        else:
+            weather = next(w for w in source if w.effect is self.__effect)
 
         if self.__icon_view is None:
             self.__add_views(weather)
         else:
-            self.__icon_view.set_image(get_weather_icon(weather.day))
+            self.__icon_view.set_image(_icon_for(weather.day, self.ICON_SIZE, self.ICON_SIZE))
             self.__day_label_view.set_text(get_day_name(weather.day))
-            self.__subtitle_label_view.set_text(self.__get_detailed_label(weather))
+            self.__subtitle_value_view.set_text(self.__get_detailed_values(weather))
+            # no-op unless the provider's temperature unit changed
+            self.__subtitle_unit_view.set_text(self.__get_detailed_units())
 
+        self.__last_source = source
         self.invalidate()
 
 
 class MiniWeatherView(VGroup):
+    ICON_SIZE = 32
+
     def __init__(self, context: Context, provider: WeatherProvider,
                  effect: WeatherEffectiveness = WeatherEffectiveness.CURRENT,
                  prefer: ViewMeasurement = ViewMeasurement.default()):
@@ -390,6 +481,8 @@ class MiniWeatherView(VGroup):
         self.__effect = effect
         self.__icon_view = None
         self.__label = None
+        self.__last_source = _UNSET
+        self.__last_weather = None
         super().__init__(context, ViewAlignmentHorizontal.CENTER, prefer)
         self.refresh()
 
@@ -399,14 +492,18 @@ class MiniWeatherView(VGroup):
     def set_provider(self, provider: WeatherProvider):
         if self.__provider != provider:
             self.__provider = provider
+            self.__last_source = _UNSET
+            self.__last_weather = None
             self.refresh()
 
     def get_effect(self):
         return self.__effect
 
     def set_effect(self, effect: WeatherEffectiveness):
-        if self.__effect != effect:
+        if self.__effect is not effect:
             self.__effect = effect
+            self.__last_source = _UNSET
+            self.__last_weather = None
             self.refresh()
 
     def __get_label(self, weather: Weather) -> str:
@@ -416,8 +513,8 @@ class MiniWeatherView(VGroup):
     def __add_views(self, weather: Weather):
         self.__icon_view = ImageView(
             self.context,
-            image=get_weather_icon(weather.day),
-            prefer=ViewMeasurement.default(width=32, height=32)
+            image=_icon_for(weather.day, self.ICON_SIZE, self.ICON_SIZE),
+            prefer=ViewMeasurement.default(width=self.ICON_SIZE, height=self.ICON_SIZE)
         )
         self.__label = TextView(
             self.context,
@@ -427,13 +524,22 @@ class MiniWeatherView(VGroup):
         self.add_views(self.__icon_view, self.__label)
 
     def refresh(self):
-        weather = next(w for w in self.__provider.get_weather()
-                       if self.__effect == WeatherEffectiveness.ANY or w.effect == self.__effect)
-        if self.__icon_view is None:
-            self.__add_views(weather)
+        source = self.__provider.get_weather()
+        if source is self.__last_source:
+            return
+        if self.__effect is WeatherEffectiveness.ANY or source[0].effect is self.__effect:
+            # providers list the current weather first
+            weather = source[0]
         else:
-            self.__icon_view.set_image(get_weather_icon(weather.day))
-            self.__label.set_text(get_day_name(weather.day))
+            weather = next(w for w in source if w.effect is self.__effect)
+        if weather is not self.__last_weather:
+            if self.__icon_view is None:
+                self.__add_views(weather)
+            else:
+                self.__icon_view.set_image(_icon_for(weather.day, self.ICON_SIZE, self.ICON_SIZE))
+                self.__label.set_text(self.__get_label(weather))
+            self.__last_weather = weather
+        self.__last_source = source
 
 
 class WeatherTrendView(TrendChartsView):
@@ -479,33 +585,54 @@ class WeatherTrendView(TrendChartsView):
         self.__provider = provider
         self.__effect = effect
         self.__value = value
+        self.__filtered_source = None
+        self.__filtered_cache = None
+        self.__render_icon = lru_cache(maxsize=64)(self.__render_icon_impl)
+        self.__last_source = _UNSET
+        self.__last_refresh_hour = None
         self.refresh()
 
     @staticmethod
     def label(w: Weather) -> int:
-        current_time = pytime.localtime()
-        return w.time.tm_hour - current_time.tm_hour + 24 * (w.time.tm_yday - current_time.tm_yday) + \
-            365 * (w.time.tm_year - current_time.tm_year)
+        return w.hours_since_epoch - hours_of(pytime.localtime())
+
+    def __filtered_weather(self) -> List[Weather]:
+        """
+        Weather entries matching this view's effect, rebuilt only when
+        the provider hands out a different list
+        """
+        source = self.__provider.get_weather()
+        if source is not self.__filtered_source:
+            effect = self.__effect
+            self.__filtered_cache = [w for w in source
+                                     if effect is WeatherEffectiveness.ANY or w.effect is effect]
+            self.__filtered_source = source
+        return self.__filtered_cache
 
     @cache
-    def __get_icon_sample(self) -> VGroup | None:
-        weather = (w for w in self.__provider.get_weather()
-                   if self.__effect == WeatherEffectiveness.ANY or w.effect == self.__effect)
-        try:
-            w = next(weather)
-        except:
+    def __get_icon_sample(self) -> Tuple[VGroup, Tuple[float, float]] | None:
+        weather = self.__filtered_weather()
+        if not weather:
             return
 
-        return self.__get_icon_view(w)
+        group = self.__get_icon_view(weather[0])
+        return group, group.actual_measurement.size
 
     def __get_icon_view(self, weather: Weather):
+        return self.__build_icon_view(self.__format_time(weather.time), weather)
+
+    @staticmethod
+    def __format_time(time: pytime.struct_time) -> str:
+        return f'{time.tm_hour:02d}:{time.tm_min:02d}'
+
+    def __build_icon_view(self, time_text: str, weather: Weather):
         group = VGroup(
             self.context,
             alignment=ViewAlignmentHorizontal.CENTER
         )
         time = TextView(
             self.context,
-            text=pytime.strftime('%H:%M', weather.time)
+            text=time_text
         )
         view = MiniWeatherView(
             self.context, DirectWeatherProvider(weather),
@@ -519,37 +646,55 @@ class WeatherTrendView(TrendChartsView):
         )
         return group
 
+    def __render_icon_impl(self, day: Day, time_text: str, temperature: float, scale: float) \
+            -> Tuple[Image.Image, Tuple[float, float]]:
+        """
+        Draw an x-axis icon onto its own canvas. Wrapped by an LRU cache,
+        so every argument that changes the output must be part of the key
+        :return: the rendered canvas and its size
+        """
+        icon_view = self.__build_icon_view(time_text, Weather(day=day, temperature=temperature))
+        # already measured while building
+        size = icon_view.actual_measurement.size
+        view_canvas = Image.new('L', size, color=COLOR_TRANSPARENT)
+        icon_view.draw(ImageDraw.Draw(view_canvas), scale)
+        return view_canvas, size
+
     def x_axis_size(self) -> float:
         sample = self.__get_icon_sample()
         if sample is None:
             return 0
-        return sample.content_size()[1] + 10
+        return sample[1][1] + 10
 
     def draw_x_axis(self, canvas: ImageDraw.ImageDraw, bounds: Tuple[int, int], scale: float):
-        sample_size = self.__get_icon_sample()
-        if sample_size is None:
+        sample = self.__get_icon_sample()
+        if sample is None:
             return
-        sample_size = sample_size.content_size()
+        sample_size = sample[1]
         canvas.line(((0, self.get_line_width() / 2), (bounds[0], self.get_line_width() / 2)),
                     fill=self.get_line_fill(),
                     width=int(self.get_line_width() * scale))
-        data = [w for w in self.__provider.get_weather()
-                if self.__effect == WeatherEffectiveness.ANY or w.effect == self.__effect]
+        data = self.__filtered_weather()
         stacked = int(bounds[0] / (sample_size[1] + 20))
         span = (bounds[0] - 20) / stacked
         for i in range(stacked):
             index = int(i / (stacked - 1) * (len(data) - 1))
             w = data[index]
 
-            icon_view = self.__get_icon_view(w)
-            icon_content_size = icon_view.content_size()
-            view_canvas = Image.new('L', icon_content_size, color=COLOR_TRANSPARENT)
-            canvas_draw = ImageDraw.Draw(view_canvas)
-            icon_view.draw(canvas_draw, scale)
+            view_canvas, icon_content_size = self.__render_icon(
+                w.day, self.__format_time(w.time), w.temperature, scale
+            )
             overlay(canvas._image, view_canvas,
                     (int(i * span + 20 + span / 2 - icon_content_size[1] / 2), 10))
 
     def refresh(self):
-        data = [(self.label(w), self.__value(w)) for w in self.__provider.get_weather()
-                if self.__effect == WeatherEffectiveness.ANY or w.effect == self.__effect]
+        source = self.__provider.get_weather()
+        # x values are relative to the current hour, so they go stale with it
+        now = hours_of(pytime.localtime())
+        if source is self.__last_source and now == self.__last_refresh_hour:
+            return
+        value = self.__value
+        data = [(w.hours_since_epoch - now, value(w)) for w in self.__filtered_weather()]
         self.set_data(data)
+        self.__last_source = source
+        self.__last_refresh_hour = now